@@ -1,23 +1,40 @@
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 from datetime import datetime, date
+from itertools import chain
 import logging
+import logging.handlers
+import queue
+import re
 import sqlite3
-
-#Logging
-logging.basicConfig(
-    filename="clinica_veterinaria.log",
-    encoding='utf-8',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+import sys
+
+#Logging: los registros se acumulan en memoria y se escriben al archivo por lotes
+#(o de inmediato si llega un ERROR o superior). Durante main() se atiende desde un QueueListener.
+_log_file_handler = logging.FileHandler("clinica_veterinaria.log", encoding='utf-8')
+_log_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+logging.getLogger().addHandler(
+    logging.handlers.MemoryHandler(1024, flushLevel=logging.ERROR, target=_log_file_handler)
 )
+logging.getLogger().setLevel(logging.INFO)
+
+#Separadores de la interfaz, construidos una sola vez
+_TITLE_BAR = "=" * 60
+_ROW_SEP = "-" * 30
+
+#Un ID válido es un entero no negativo escrito solo con dígitos; 18 cifras caben siempre en un INTEGER de SQLite (64 bits)
+_ID_RE = re.compile(r"[0-9]{1,18}")
+
+def _render_title(text):
+    """Devuelve el encabezado de una sección ya formateado."""
+    return f"\n{_TITLE_BAR}\n{text.center(60)}\n{_TITLE_BAR}\n\n"
 
 #Clases de Utilidad para Consola
 class UIUtils:
     """Clase estática para utilidades de interfaz de usuario en consola."""
     @staticmethod
     def print_title(text):
-        print("\n" + "=" * 60)
-        print(f"{text.center(60)}")
-        print("=" * 60 + "\n")
+        sys.stdout.write(_render_title(text))
 
     @staticmethod
     def print_message(text):
@@ -32,7 +49,17 @@ class UIUtils:
                 return value
             except ValueError:
                 print(error_msg)
-                logging.error(f"Entrada no numérica: '{prompt.strip()}'")
+                logging.error("Entrada no numérica: '%s'", prompt.strip())
+
+    @staticmethod
+    def get_id_input(prompt, error_msg="ID inválido. Por favor, ingrese un número."):
+        """Solicita un ID y lo valida antes de consultar la base de datos."""
+        while True:
+            text = input(prompt).strip()
+            if _ID_RE.fullmatch(text):
+                return int(text)
+            print(error_msg)
+            logging.error("ID inválido: '%s'", text)
 
     @staticmethod
     def get_date_input(prompt, error_msg="Formato de fecha incorrecto. Use dd-mm-aaaa. Ejemplo: 05-06-2025."):
@@ -43,7 +70,7 @@ class UIUtils:
                 return datetime.strptime(date_str, "%d-%m-%Y").date()
             except ValueError:
                 print(error_msg)
-                logging.error(f"Formato de fecha inválido: '{date_str}'")
+                logging.error("Formato de fecha inválido: '%s'", date_str)
 
     @staticmethod
     def confirm_action(prompt):
@@ -58,6 +85,8 @@ class UIUtils:
 
 #Clases Mascota, Propietario, Consulta
 class Propietario:
+    __slots__ = ("id", "nombre", "telefono", "direccion")
+
     def __init__(self, nombre, telefono, direccion, id=None):
         self.id = id
         self.nombre = nombre
@@ -73,6 +102,8 @@ class Propietario:
         )
 
 class Mascota:
+    __slots__ = ("id", "nombre", "especie", "raza", "edad", "propietario_id", "propietario_nombre")
+
     def __init__(self, nombre, especie, raza, edad, propietario_id, id=None, propietario_nombre=None):
         self.id = id
         self.nombre = nombre
@@ -94,17 +125,20 @@ class Mascota:
         )
 
 class Consulta:
+    __slots__ = ("id", "fecha", "_fecha_str", "motivo", "diagnostico", "mascota_id", "mascota_nombre")
+
     def __init__(self, fecha, motivo, diagnostico, mascota_id, id=None, mascota_nombre=None):
         self.id = id
         if isinstance(fecha, date):
             self.fecha = fecha
         elif isinstance(fecha, str):
             try:
-                self.fecha = datetime.strptime(fecha, "%Y-%m-%d").date()
+                self.fecha = date.fromisoformat(fecha)
             except ValueError:
                 raise ValueError("Formato de fecha de la cadena incorrecto. Esperado YYYY-MM-DD.")
         else:
             raise ValueError("El argumento 'fecha' debe ser una cadena (YYYY-MM-DD) o un objeto datetime.date")
+        self._fecha_str = f"{self.fecha.day:02d}-{self.fecha.month:02d}-{self.fecha.year}" # dd-mm-aaaa para __str__
         self.motivo = motivo
         self.diagnostico = diagnostico
         self.mascota_id = mascota_id
@@ -113,302 +147,644 @@ class Consulta:
     def __str__(self):
         return (
             f"ID Consulta: {self.id}\n"
-            f"Fecha: {self.fecha.strftime('%d-%m-%Y')}\n"
+            f"Fecha: {self._fecha_str}\n"
             f"Motivo: {self.motivo}\n"
             f"Diagnóstico: {self.diagnostico}\n"
             f"Mascota: {self.mascota_nombre if self.mascota_nombre else f'ID Mascota: {self.mascota_id}'}"
         )
 
+#Filas de solo lectura para los listados: se construyen en C sin pasar por __init__
+class PropietarioRow(namedtuple("PropietarioRow", "id nombre telefono direccion")):
+    __slots__ = ()
+    __str__ = Propietario.__str__
+
+class MascotaRow(namedtuple("MascotaRow", "id nombre especie raza edad propietario_id propietario_nombre")):
+    __slots__ = ()
+    __str__ = Mascota.__str__
+
+#Versión del esquema guardada en PRAGMA user_version; increméntela al cambiar el DDL
+CURRENT_SCHEMA_VERSION = 1
+
+#Sentencias SQL (constantes para reutilizar la caché de sentencias preparadas de sqlite3)
+#BEGIN IMMEDIATE toma el bloqueo de escritura al empezar, así la transacción no puede fallar a mitad con SQLITE_BUSY.
+SQL_BEGIN_IMMEDIATE = "BEGIN IMMEDIATE"
+SQL_GET_USER_VERSION = "PRAGMA user_version"
+SQL_SET_USER_VERSION = f"PRAGMA user_version = {CURRENT_SCHEMA_VERSION}"
+
+SQL_CREATE_PROPIETARIOS = """
+    CREATE TABLE IF NOT EXISTS propietarios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL UNIQUE,
+        telefono TEXT,
+        direccion TEXT
+    )
+"""
+SQL_CREATE_MASCOTAS = """
+    CREATE TABLE IF NOT EXISTS mascotas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        especie TEXT,
+        raza TEXT,
+        edad INTEGER,
+        id_propietario INTEGER,
+        FOREIGN KEY (id_propietario) REFERENCES propietarios(id) ON DELETE CASCADE
+    )
+"""
+SQL_CREATE_CONSULTAS = """
+    CREATE TABLE IF NOT EXISTS consultas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        fecha TEXT NOT NULL,
+        motivo TEXT,
+        diagnostico TEXT,
+        id_mascota INTEGER,
+        FOREIGN KEY (id_mascota) REFERENCES mascotas(id) ON DELETE CASCADE
+    )
+"""
+SQL_CREATE_INDEX_MASCOTAS_PROPIETARIO = "CREATE INDEX IF NOT EXISTS idx_mascotas_prop ON mascotas(id_propietario)"
+SQL_CREATE_INDEX_CONSULTAS_MASCOTA_FECHA = "CREATE INDEX IF NOT EXISTS idx_consultas_masc_fecha ON consultas(id_mascota, fecha DESC)"
+#El índice UNIQUE de nombre usa la collation BINARY; este permite la búsqueda exacta sin distinguir mayúsculas.
+SQL_CREATE_INDEX_PROPIETARIOS_NOMBRE = "CREATE INDEX IF NOT EXISTS idx_propietarios_nombre_nocase ON propietarios(nombre COLLATE NOCASE)"
+
+#Índice de texto completo sobre propietarios(nombre), sincronizado mediante triggers
+SQL_CREATE_PROPIETARIOS_FTS = "CREATE VIRTUAL TABLE IF NOT EXISTS propietarios_fts USING fts5(nombre, content='propietarios', content_rowid='id')"
+SQL_CREATE_PROPIETARIOS_FTS_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS propietarios_fts_ai AFTER INSERT ON propietarios BEGIN
+        INSERT INTO propietarios_fts(rowid, nombre) VALUES (new.id, new.nombre);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS propietarios_fts_ad AFTER DELETE ON propietarios BEGIN
+        INSERT INTO propietarios_fts(propietarios_fts, rowid, nombre) VALUES ('delete', old.id, old.nombre);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS propietarios_fts_au AFTER UPDATE OF nombre ON propietarios BEGIN
+        INSERT INTO propietarios_fts(propietarios_fts, rowid, nombre) VALUES ('delete', old.id, old.nombre);
+        INSERT INTO propietarios_fts(rowid, nombre) VALUES (new.id, new.nombre);
+    END
+    """,
+)
+SQL_SELECT_PROPIETARIOS_FTS_EXISTS = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'propietarios_fts'"
+SQL_REBUILD_PROPIETARIOS_FTS = "INSERT INTO propietarios_fts(propietarios_fts) VALUES ('rebuild')"
+SQL_SEARCH_PROPIETARIOS_FTS = """
+    SELECT p.id, p.nombre, p.telefono, p.direccion
+    FROM propietarios_fts f
+    JOIN propietarios p ON p.id = f.rowid
+    WHERE propietarios_fts MATCH ?
+    ORDER BY f.rank
+"""
+#Alternativa sin FTS5, también por prefijo de palabra: el texto (con %, _ y \ escapados)
+#debe iniciar el nombre o una palabra precedida por un espacio.
+SQL_SEARCH_PROPIETARIOS_LIKE = r"""
+    SELECT id, nombre, telefono, direccion FROM propietarios
+    WHERE nombre LIKE ? || '%' ESCAPE '\' OR nombre LIKE '% ' || ? || '%' ESCAPE '\'
+"""
+
+SQL_INSERT_PROPIETARIO = "INSERT INTO propietarios (nombre, telefono, direccion) VALUES (?, ?, ?)"
+#Inserta el propietario solo si no existe otro con el mismo nombre (sin distinguir mayúsculas).
+SQL_UPSERT_PROPIETARIO = """
+    INSERT INTO propietarios (nombre, telefono, direccion)
+    SELECT ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM propietarios WHERE nombre = ? COLLATE NOCASE)
+    ON CONFLICT(nombre) DO NOTHING
+    RETURNING id, nombre, telefono, direccion
+"""
+SQL_SELECT_PROPIETARIO_BY_NOMBRE = "SELECT id, nombre, telefono, direccion FROM propietarios WHERE nombre = ? COLLATE NOCASE"
+SQL_SELECT_PROPIETARIO_BY_ID = "SELECT id, nombre, telefono, direccion FROM propietarios WHERE id = ?"
+SQL_SELECT_ALL_PROPIETARIOS = "SELECT id, nombre, telefono, direccion FROM propietarios"
+SQL_SELECT_PROPIETARIO_NOMBRES = "SELECT id, nombre FROM propietarios"
+SQL_UPDATE_PROPIETARIO = """
+    UPDATE propietarios
+    SET nombre = COALESCE(?, nombre), telefono = COALESCE(?, telefono), direccion = COALESCE(?, direccion)
+    WHERE id = ?
+"""
+SQL_DELETE_PROPIETARIO = "DELETE FROM propietarios WHERE id = ?"
+
+SQL_INSERT_MASCOTA = "INSERT INTO mascotas (nombre, especie, raza, edad, id_propietario) VALUES (?, ?, ?, ?, ?)"
+SQL_SELECT_ALL_MASCOTAS = "SELECT id, nombre, especie, raza, edad, id_propietario FROM mascotas"
+SQL_SELECT_MASCOTA_BY_ID = "SELECT id, nombre, especie, raza, edad, id_propietario FROM mascotas WHERE id = ?"
+SQL_UPDATE_MASCOTA = """
+    UPDATE mascotas
+    SET nombre = COALESCE(?, nombre), especie = COALESCE(?, especie), raza = COALESCE(?, raza),
+        edad = COALESCE(?, edad), id_propietario = COALESCE(?, id_propietario)
+    WHERE id = ?
+"""
+SQL_DELETE_MASCOTA = "DELETE FROM mascotas WHERE id = ?"
+
+SQL_INSERT_CONSULTA = "INSERT INTO consultas (fecha, motivo, diagnostico, id_mascota) VALUES (?, ?, ?, ?)"
+SQL_SELECT_CONSULTAS_BY_MASCOTA_ID = """
+    SELECT id, fecha, motivo, diagnostico, id_mascota
+    FROM consultas
+    WHERE id_mascota = ?
+    ORDER BY fecha DESC
+"""
+SQL_SELECT_CONSULTA_BY_ID = """
+    SELECT c.id, c.fecha, c.motivo, c.diagnostico, c.id_mascota, m.nombre AS mascota_nombre
+    FROM consultas c
+    JOIN mascotas m ON c.id_mascota = m.id
+    WHERE c.id = ?
+"""
+SQL_UPDATE_CONSULTA = """
+    UPDATE consultas
+    SET fecha = COALESCE(?, fecha), motivo = COALESCE(?, motivo), diagnostico = COALESCE(?, diagnostico)
+    WHERE id = ?
+"""
+SQL_DELETE_CONSULTA = "DELETE FROM consultas WHERE id = ? RETURNING id"
+
+SQL_LAST_INSERT_ROWID = "SELECT last_insert_rowid()"
+
+#Tamaño de la caché de sentencias preparadas por conexión (por defecto sqlite3 usa 128)
+CACHED_STATEMENTS = 256
+
+#Segundos que la conexión espera por un bloqueo antes de fallar con "database is locked"
+#(es el valor por defecto de sqlite3.connect, se deja explícito para no depender de él)
+BUSY_TIMEOUT = 5.0
+
+#Entradas máximas de las cachés LRU de propietarios y mascotas por ID
+ID_CACHE_SIZE = 256
+
+#Filas materializadas por cada fetchmany() en los cursores del gestor
+FETCH_ARRAYSIZE = 128
+
+#PRAGMAs aplicados en cada conexión: WAL con synchronous=NORMAL reduce los fsync por commit,
+#y foreign_keys=ON es necesario para que ON DELETE CASCADE tenga efecto.
+CONNECTION_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-20000",
+    "foreign_keys=ON",
+)
+
 #Gestor SQLite
 class DatabaseManager:
+    __slots__ = (
+        "db_name", "conn", "read_cursor", "write_cursor",
+        "_prop_name_cache", "_prop_cache", "_masc_cache", "fts_enabled", "_stmt_cache",
+    )
+
     def __init__(self, db_name="clinica_veterinaria.db"):
         self.db_name = db_name
         self.conn = None
-        self.cursor = None
+        self.read_cursor = None
+        self.write_cursor = None
+        self._prop_name_cache = None # {id: nombre} de propietarios, se invalida al escribir en propietarios
+        self._prop_cache = OrderedDict() # LRU de get_propietario_by_id
+        self._masc_cache = OrderedDict() # LRU de get_mascota_by_id
+        self.fts_enabled = False # False si este SQLite no incluye FTS5
+        self._stmt_cache = {} # {sql: cursor} para las lecturas de listados, ver _exec()
         self.connect()
         self.create_tables()
 
     def connect(self):
         try:
-            self.conn = sqlite3.connect(self.db_name)
-            self.cursor = self.conn.cursor()
-            logging.info(f"Conexión a la base de datos {self.db_name} establecida.")
+            self.conn = sqlite3.connect(
+                self.db_name, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS, isolation_level=None
+            ) # Autocommit: las transacciones se abren explícitamente en transaction()
+            # Cursores separados: las lecturas no pisan el estado (lastrowid, rowcount) de las escrituras.
+            self.read_cursor = self.conn.cursor()
+            self.read_cursor.row_factory = sqlite3.Row
+            self.read_cursor.arraysize = FETCH_ARRAYSIZE
+            self.write_cursor = self.conn.cursor()
+            for pragma in CONNECTION_PRAGMAS:
+                self.write_cursor.execute(f"PRAGMA {pragma}")
         except sqlite3.Error as e:
-            logging.error(f"Error al conectar a la base de datos: {e}")
+            logging.error("Error al conectar a la base de datos: %s", e)
             print(f"Error al conectar a la base de datos: {e}")
 
     def close_connection(self):
         if self.conn:
             self.conn.close()
-            logging.info(f"Conexión a la base de datos {self.db_name} cerrada.")
 
-    def create_tables(self):
+    @contextmanager
+    def transaction(self):
+        """Agrupa varias escrituras en una transacción BEGIN IMMEDIATE; si ya hay una abierta, se une a ella."""
+        if self.conn.in_transaction:
+            yield
+            return
+        self.write_cursor.execute(SQL_BEGIN_IMMEDIATE)
         try:
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS propietarios (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    nombre TEXT NOT NULL UNIQUE,
-                    telefono TEXT,
-                    direccion TEXT
-                )
-            """)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS mascotas (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    nombre TEXT NOT NULL,
-                    especie TEXT,
-                    raza TEXT,
-                    edad INTEGER,
-                    id_propietario INTEGER,
-                    FOREIGN KEY (id_propietario) REFERENCES propietarios(id) ON DELETE CASCADE
-                )
-            """)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS consultas (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    fecha TEXT NOT NULL,
-                    motivo TEXT,
-                    diagnostico TEXT,
-                    id_mascota INTEGER,
-                    FOREIGN KEY (id_mascota) REFERENCES mascotas(id) ON DELETE CASCADE
-                )
-            """)
+            yield
             self.conn.commit()
-            logging.info("Tablas creadas o ya existentes.")
+        except BaseException:
+            self.conn.rollback()
+            self._invalidate_caches()
+            raise
+
+    def create_tables(self):
+        try:
+            # El DDL solo se ejecuta si la base de datos tiene un esquema anterior al actual.
+            version = self.write_cursor.execute(SQL_GET_USER_VERSION).fetchone()[0]
+            if version < CURRENT_SCHEMA_VERSION:
+                with self.transaction():
+                    self.write_cursor.execute(SQL_CREATE_PROPIETARIOS)
+                    self.write_cursor.execute(SQL_CREATE_MASCOTAS)
+                    self.write_cursor.execute(SQL_CREATE_CONSULTAS)
+                    self.write_cursor.execute(SQL_CREATE_INDEX_MASCOTAS_PROPIETARIO)
+                    self.write_cursor.execute(SQL_CREATE_INDEX_CONSULTAS_MASCOTA_FECHA)
+                    self.write_cursor.execute(SQL_CREATE_INDEX_PROPIETARIOS_NOMBRE)
+                    self.write_cursor.execute(SQL_SET_USER_VERSION)
         except sqlite3.Error as e:
-            logging.error(f"Error al crear tablas: {e}")
+            logging.error("Error al crear tablas: %s", e)
             print(f"Error al crear tablas: {e}")
+        self._create_fts()
+
+    def rollback(self):
+        """Descarta la transacción abierta (p. ej. cuando falla un paso dentro de transaction())."""
+        self.conn.rollback()
+        self._invalidate_caches()
+
+    def _create_fts(self):
+        """Crea el índice FTS5 de nombres de propietarios; si FTS5 no está disponible, la búsqueda usa LIKE."""
+        try:
+            if self.write_cursor.execute(SQL_SELECT_PROPIETARIOS_FTS_EXISTS).fetchone():
+                self.fts_enabled = True
+                return
+            with self.transaction():
+                self.write_cursor.execute(SQL_CREATE_PROPIETARIOS_FTS)
+                for trigger in SQL_CREATE_PROPIETARIOS_FTS_TRIGGERS:
+                    self.write_cursor.execute(trigger)
+                # Indexa los propietarios registrados antes de crear la tabla FTS.
+                self.write_cursor.execute(SQL_REBUILD_PROPIETARIOS_FTS)
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            logging.warning("Búsqueda de texto completo no disponible: %s", e)
+
+    def _exec(self, sql, params=(), row_factory=None):
+        """Ejecuta una lectura de listado en un cursor reservado para ese SQL, creado una sola vez."""
+        cursor = self._stmt_cache.get(sql)
+        if cursor is None:
+            cursor = self.conn.cursor()
+            cursor.arraysize = FETCH_ARRAYSIZE
+            self._stmt_cache[sql] = cursor
+        cursor.row_factory = row_factory
+        return cursor.execute(sql, params)
+
+    @staticmethod
+    def _iter_batches(cursor):
+        """Recorre el resultado en lotes de cursor.arraysize filas (ya convertidas por el row_factory del cursor)."""
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                return
+            yield rows
+
+    def _invalidate_caches(self):
+        """Descarta todas las cachés de lectura (p. ej. tras un rollback)."""
+        self._prop_name_cache = None
+        self._prop_cache.clear()
+        self._masc_cache.clear()
+
+    @staticmethod
+    def _cache_get(cache, key):
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    @staticmethod
+    def _cache_put(cache, key, value):
+        cache[key] = value
+        if len(cache) > ID_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def _load_prop_names(self):
+        """Devuelve el diccionario {id: nombre} de propietarios, cargándolo una vez por sesión."""
+        if self._prop_name_cache is None:
+            self.read_cursor.execute(SQL_SELECT_PROPIETARIO_NOMBRES)
+            self._prop_name_cache = dict(self.read_cursor.fetchall())
+        return self._prop_name_cache
 
     #CRUD Propietario
     def insert_propietario(self, propietario):
         try:
-            self.cursor.execute(
-                "INSERT INTO propietarios (nombre, telefono, direccion) VALUES (?, ?, ?)",
-                (propietario.nombre, propietario.telefono, propietario.direccion)
-            )
-            self.conn.commit()
-            propietario.id = self.cursor.lastrowid
-            logging.info(f"Propietario '{propietario.nombre}' insertado con ID: {propietario.id}")
+            with self.transaction():
+                self.write_cursor.execute(
+                    SQL_INSERT_PROPIETARIO,
+                    (propietario.nombre, propietario.telefono, propietario.direccion)
+                )
+            propietario.id = self.write_cursor.lastrowid
+            self._prop_name_cache = None
             return propietario
         except sqlite3.IntegrityError:
-            logging.warning(f"Intento de insertar propietario duplicado: {propietario.nombre}")
+            logging.warning("Intento de insertar propietario duplicado: %s", propietario.nombre)
             return None
         except sqlite3.Error as e:
-            logging.error(f"Error al insertar propietario: {e}")
+            logging.error("Error al insertar propietario: %s", e)
             return None
 
+    def upsert_propietario(self, propietario):
+        """Inserta el propietario si su nombre no existe. Devuelve (propietario, creado)."""
+        try:
+            with self.transaction():
+                self.write_cursor.execute(
+                    SQL_UPSERT_PROPIETARIO,
+                    (propietario.nombre, propietario.telefono, propietario.direccion, propietario.nombre)
+                )
+                rows = self.write_cursor.fetchall() # Consume el RETURNING para que la sentencia termine antes del COMMIT
+        except sqlite3.Error as e:
+            logging.error("Error al insertar propietario: %s", e)
+            return None, False
+        if rows:
+            row = rows[0]
+            self._prop_name_cache = None
+            return Propietario(row[1], row[2], row[3], row[0]), True
+        # Ya existía: es la única consulta adicional y solo ocurre en este caso.
+        return self.get_propietario_by_nombre(propietario.nombre), False
+
     def get_propietario_by_nombre(self, nombre):
         try:
-            self.cursor.execute("SELECT id, nombre, telefono, direccion FROM propietarios WHERE nombre LIKE ?", (nombre,))
-            row = self.cursor.fetchone()
+            self.read_cursor.execute(SQL_SELECT_PROPIETARIO_BY_NOMBRE, (nombre,))
+            row = self.read_cursor.fetchone()
             if row:
-                return Propietario(row[1], row[2], row[3], row[0])
+                return Propietario(row["nombre"], row["telefono"], row["direccion"], row["id"])
             return None
         except sqlite3.Error as e:
-            logging.error(f"Error al buscar propietario por nombre: {e}")
+            logging.error("Error al buscar propietario por nombre: %s", e)
             return None
 
+    def search_propietarios(self, texto):
+        """Busca propietarios cuyo nombre contenga una palabra que empiece por el texto indicado."""
+        try:
+            row_factory = lambda cur, row: PropietarioRow(*row)
+            if self.fts_enabled:
+                # Se pasa como frase entre comillas para que la sintaxis de FTS5 del usuario no se interprete.
+                cursor = self._exec(SQL_SEARCH_PROPIETARIOS_FTS, ('"' + texto.replace('"', '""') + '"*',), row_factory)
+            else:
+                patron = texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                cursor = self._exec(SQL_SEARCH_PROPIETARIOS_LIKE, (patron, patron), row_factory)
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            logging.error("Error al buscar propietarios: %s", e)
+            return []
+
     def get_propietario_by_id(self, propietario_id):
+        propietario = self._cache_get(self._prop_cache, propietario_id)
+        if propietario:
+            return propietario
         try:
-            self.cursor.execute("SELECT id, nombre, telefono, direccion FROM propietarios WHERE id = ?", (propietario_id,))
-            row = self.cursor.fetchone()
+            self.read_cursor.execute(SQL_SELECT_PROPIETARIO_BY_ID, (propietario_id,))
+            row = self.read_cursor.fetchone()
             if row:
-                return Propietario(row[1], row[2], row[3], row[0])
+                propietario = Propietario(row["nombre"], row["telefono"], row["direccion"], row["id"])
+                self._cache_put(self._prop_cache, propietario_id, propietario)
+                return propietario
             return None
         except sqlite3.Error as e:
-            logging.error(f"Error al buscar propietario por ID: {e}")
+            logging.error("Error al buscar propietario por ID: %s", e)
             return None
 
     def get_all_propietarios(self):
+        return list(chain.from_iterable(self.iter_propietarios()))
+
+    def iter_propietarios(self):
+        """Entrega los propietarios por lotes sin materializar la tabla entera."""
         try:
-            self.cursor.execute("SELECT id, nombre, telefono, direccion FROM propietarios")
-            rows = self.cursor.fetchall()
-            return [Propietario(row[1], row[2], row[3], row[0]) for row in rows]
+            cursor = self._exec(SQL_SELECT_ALL_PROPIETARIOS, row_factory=lambda cur, row: PropietarioRow(*row))
+            yield from self._iter_batches(cursor)
         except sqlite3.Error as e:
-            logging.error(f"Error al obtener todos los propietarios: {e}")
-            return []
+            logging.error("Error al obtener todos los propietarios: %s", e)
 
     def update_propietario(self, propietario_id, new_data):
         try:
-            set_clause = ", ".join([f"{k} = ?" for k in new_data.keys()])
-            values = list(new_data.values())
-            values.append(propietario_id)
-            self.cursor.execute(f"UPDATE propietarios SET {set_clause} WHERE id = ?", tuple(values))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+            with self.transaction():
+                # Sentencia de forma fija: los campos ausentes se enlazan como NULL y COALESCE conserva el valor actual.
+                self.write_cursor.execute(SQL_UPDATE_PROPIETARIO, (
+                    new_data.get('nombre'), new_data.get('telefono'), new_data.get('direccion'), propietario_id
+                ))
+                self._prop_name_cache = None
+                self._prop_cache.pop(propietario_id, None)
+                self._masc_cache.clear() # las mascotas guardan el nombre del propietario
+            return self.write_cursor.rowcount > 0
         except sqlite3.Error as e:
-            logging.error(f"Error al actualizar propietario: {e}")
+            logging.error("Error al actualizar propietario: %s", e)
             return False
 
     def delete_propietario(self, propietario_id):
         try:
-            self.cursor.execute("DELETE FROM propietarios WHERE id = ?", (propietario_id,))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+            with self.transaction():
+                self.write_cursor.execute(SQL_DELETE_PROPIETARIO, (propietario_id,))
+                self._prop_name_cache = None
+                self._prop_cache.pop(propietario_id, None)
+                self._masc_cache.clear() # ON DELETE CASCADE elimina sus mascotas
+            return self.write_cursor.rowcount > 0
         except sqlite3.Error as e:
-            logging.error(f"Error al eliminar propietario: {e}")
+            logging.error("Error al eliminar propietario: %s", e)
             return False
 
     #CRUD Mascota
     def insert_mascota(self, mascota):
         try:
-            self.cursor.execute(
-                "INSERT INTO mascotas (nombre, especie, raza, edad, id_propietario) VALUES (?, ?, ?, ?, ?)",
-                (mascota.nombre, mascota.especie, mascota.raza, mascota.edad, mascota.propietario_id)
-            )
-            self.conn.commit()
-            mascota.id = self.cursor.lastrowid
-            logging.info(f"Mascota '{mascota.nombre}' insertada con ID: {mascota.id}")
+            with self.transaction():
+                self.write_cursor.execute(
+                    SQL_INSERT_MASCOTA,
+                    (mascota.nombre, mascota.especie, mascota.raza, mascota.edad, mascota.propietario_id)
+                )
+            mascota.id = self.write_cursor.lastrowid
             return mascota
         except sqlite3.Error as e:
-            logging.error(f"Error al insertar mascota: {e}")
+            logging.error("Error al insertar mascota: %s", e)
             return None
 
     def get_all_mascotas(self):
+        return list(chain.from_iterable(self.iter_mascotas()))
+
+    def iter_mascotas(self):
+        """Entrega las mascotas por lotes sin materializar la tabla entera."""
         try:
-            self.cursor.execute("""
-                SELECT m.id, m.nombre, m.especie, m.raza, m.edad, m.id_propietario, p.nombre
-                FROM mascotas m
-                JOIN propietarios p ON m.id_propietario = p.id
-            """)
-            rows = self.cursor.fetchall()
-            return [Mascota(row[1], row[2], row[3], row[4], row[5], row[0], row[6]) for row in rows]
+            prop_names = self._load_prop_names()
+            cursor = self._exec(
+                SQL_SELECT_ALL_MASCOTAS, row_factory=lambda cur, row: MascotaRow(*row, prop_names.get(row[5]))
+            )
+            yield from self._iter_batches(cursor)
         except sqlite3.Error as e:
-            logging.error(f"Error al obtener todas las mascotas: {e}")
-            return []
+            logging.error("Error al obtener todas las mascotas: %s", e)
 
     def get_mascota_by_id(self, mascota_id):
+        mascota = self._cache_get(self._masc_cache, mascota_id)
+        if mascota:
+            return mascota
         try:
-            self.cursor.execute("""
-                SELECT m.id, m.nombre, m.especie, m.raza, m.edad, m.id_propietario, p.nombre
-                FROM mascotas m
-                JOIN propietarios p ON m.id_propietario = p.id
-                WHERE m.id = ?
-            """, (mascota_id,))
-            row = self.cursor.fetchone()
+            self.read_cursor.execute(SQL_SELECT_MASCOTA_BY_ID, (mascota_id,))
+            row = self.read_cursor.fetchone()
             if row:
-                return Mascota(row[1], row[2], row[3], row[4], row[5], row[0], row[6])
+                mascota = Mascota(
+                    row["nombre"], row["especie"], row["raza"], row["edad"], row["id_propietario"], row["id"],
+                    self._load_prop_names().get(row["id_propietario"])
+                )
+                self._cache_put(self._masc_cache, mascota_id, mascota)
+                return mascota
             return None
         except sqlite3.Error as e:
-            logging.error(f"Error al buscar mascota por ID: {e}")
+            logging.error("Error al buscar mascota por ID: %s", e)
             return None
 
     def update_mascota(self, mascota_id, new_data):
         try:
-            set_clause = ", ".join([f"{k} = ?" for k in new_data.keys()])
-            values = list(new_data.values())
-            values.append(mascota_id)
-            self.cursor.execute(f"UPDATE mascotas SET {set_clause} WHERE id = ?", tuple(values))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+            with self.transaction():
+                self.write_cursor.execute(SQL_UPDATE_MASCOTA, (
+                    new_data.get('nombre'), new_data.get('especie'), new_data.get('raza'),
+                    new_data.get('edad'), new_data.get('id_propietario'), mascota_id
+                ))
+                self._masc_cache.pop(mascota_id, None)
+            return self.write_cursor.rowcount > 0
         except sqlite3.Error as e:
-            logging.error(f"Error al actualizar mascota: {e}")
+            logging.error("Error al actualizar mascota: %s", e)
             return False
 
     def delete_mascota(self, mascota_id):
         try:
-            self.cursor.execute("DELETE FROM mascotas WHERE id = ?", (mascota_id,))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+            with self.transaction():
+                self.write_cursor.execute(SQL_DELETE_MASCOTA, (mascota_id,))
+                self._masc_cache.pop(mascota_id, None)
+            return self.write_cursor.rowcount > 0
         except sqlite3.Error as e:
-            logging.error(f"Error al eliminar mascota: {e}")
+            logging.error("Error al eliminar mascota: %s", e)
             return False
 
     #CRUD Consulta
     def insert_consulta(self, consulta):
         try:
-            self.cursor.execute(
-                "INSERT INTO consultas (fecha, motivo, diagnostico, id_mascota) VALUES (?, ?, ?, ?)",
-                (consulta.fecha.strftime("%Y-%m-%d"),
-                 consulta.motivo, consulta.diagnostico, consulta.mascota_id)
-            )
-            self.conn.commit()
-            consulta.id = self.cursor.lastrowid
-            logging.info(f"Consulta para mascota ID {consulta.mascota_id} registrada con ID: {consulta.id}")
+            with self.transaction():
+                self.write_cursor.execute(
+                    SQL_INSERT_CONSULTA,
+                    (consulta.fecha.isoformat(),
+                     consulta.motivo, consulta.diagnostico, consulta.mascota_id)
+                )
+            consulta.id = self.write_cursor.lastrowid
             return consulta
         except sqlite3.Error as e:
-            logging.error(f"Error al insertar consulta: {e}")
+            logging.error("Error al insertar consulta: %s", e)
             return None
 
     def get_consultas_by_mascota_id(self, mascota_id):
+        return list(chain.from_iterable(self.iter_consultas_by_mascota_id(mascota_id)))
+
+    def iter_consultas_by_mascota_id(self, mascota_id):
+        """Entrega las consultas de la mascota por lotes, de la más reciente a la más antigua."""
+        mascota = self.get_mascota_by_id(mascota_id)
+        if not mascota:
+            return
         try:
-            self.cursor.execute("""
-                SELECT c.id, c.fecha, c.motivo, c.diagnostico, c.id_mascota, m.nombre
-                FROM consultas c
-                JOIN mascotas m ON c.id_mascota = m.id
-                WHERE c.id_mascota = ?
-                ORDER BY c.fecha DESC
-            """, (mascota_id,))
-            rows = self.cursor.fetchall()
-            return [Consulta(row[1], row[2], row[3], row[4], row[0], row[5]) for row in rows]
+            # Todas las filas son de la misma mascota: su nombre sale de get_mascota_by_id (caché LRU).
+            cursor = self._exec(
+                SQL_SELECT_CONSULTAS_BY_MASCOTA_ID, (mascota_id,),
+                lambda cur, row: Consulta(row[1], row[2], row[3], row[4], row[0], mascota.nombre)
+            )
+            yield from self._iter_batches(cursor)
         except sqlite3.Error as e:
-            logging.error(f"Error al obtener consultas por ID de mascota: {e}")
-            return []
+            logging.error("Error al obtener consultas por ID de mascota: %s", e)
 
     def get_consulta_by_id(self, consulta_id):
         try:
-            self.cursor.execute("""
-                SELECT c.id, c.fecha, c.motivo, c.diagnostico, c.id_mascota, m.nombre
-                FROM consultas c
-                JOIN mascotas m ON c.id_mascota = m.id
-                WHERE c.id = ?
-            """, (consulta_id,))
-            row = self.cursor.fetchone()
+            self.read_cursor.execute(SQL_SELECT_CONSULTA_BY_ID, (consulta_id,))
+            row = self.read_cursor.fetchone()
             if row:
-                return Consulta(row[1], row[2], row[3], row[4], row[0], row[5])
+                return Consulta(
+                    row["fecha"], row["motivo"], row["diagnostico"], row["id_mascota"], row["id"], row["mascota_nombre"]
+                )
             return None
         except sqlite3.Error as e:
-            logging.error(f"Error al buscar consulta por ID: {e}")
+            logging.error("Error al buscar consulta por ID: %s", e)
             return None
 
     def update_consulta(self, consulta_id, new_data):
         try:
-            if 'fecha' in new_data and isinstance(new_data['fecha'], date):
-                new_data['fecha'] = new_data['fecha'].strftime("%Y-%m-%d")
-
-            set_clause = ", ".join([f"{k} = ?" for k in new_data.keys()])
-            values = list(new_data.values())
-            values.append(consulta_id)
-            self.cursor.execute(f"UPDATE consultas SET {set_clause} WHERE id = ?", tuple(values))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+            with self.transaction():
+                fecha = new_data.get('fecha')
+                if isinstance(fecha, date):
+                    fecha = fecha.isoformat()
+
+                self.write_cursor.execute(SQL_UPDATE_CONSULTA, (
+                    fecha, new_data.get('motivo'), new_data.get('diagnostico'), consulta_id
+                ))
+            return self.write_cursor.rowcount > 0
         except sqlite3.Error as e:
-            logging.error(f"Error al actualizar consulta: {e}")
+            logging.error("Error al actualizar consulta: %s", e)
             return False
 
     def delete_consulta(self, consulta_id):
         try:
-            self.cursor.execute("DELETE FROM consultas WHERE id = ?", (consulta_id,))
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+            with self.transaction():
+                # Las filas de RETURNING deben leerse antes del COMMIT.
+                borradas = self.write_cursor.execute(SQL_DELETE_CONSULTA, (consulta_id,)).fetchall()
+            return bool(borradas)
         except sqlite3.Error as e:
-            logging.error(f"Error al eliminar consulta: {e}")
+            logging.error("Error al eliminar consulta: %s", e)
             return False
 
+    #Inserción masiva
+    def _bulk_insert(self, sql, rows):
+        """Inserta todas las filas en una sola transacción y devuelve el ID de la primera."""
+        with self.transaction():
+            self.write_cursor.executemany(sql, rows)
+            # executemany no actualiza lastrowid; dentro de la transacción los IDs AUTOINCREMENT son consecutivos.
+            last_id = self.write_cursor.execute(SQL_LAST_INSERT_ROWID).fetchone()[0]
+        return last_id - len(rows) + 1
+
+    def insert_propietarios_bulk(self, propietarios):
+        if not propietarios:
+            return []
+        rows = [(p.nombre, p.telefono, p.direccion) for p in propietarios]
+        try:
+            first_id = self._bulk_insert(SQL_INSERT_PROPIETARIO, rows)
+            self._prop_name_cache = None
+        except sqlite3.IntegrityError:
+            logging.warning("Intento de insertar propietarios duplicados en lote.")
+            return None
+        except sqlite3.Error as e:
+            logging.error("Error al insertar propietarios en lote: %s", e)
+            return None
+        for offset, propietario in enumerate(propietarios):
+            propietario.id = first_id + offset
+        logging.info("%s propietarios insertados en lote.", len(propietarios))
+        return propietarios
+
+    def insert_mascotas_bulk(self, mascotas):
+        if not mascotas:
+            return []
+        rows = [(m.nombre, m.especie, m.raza, m.edad, m.propietario_id) for m in mascotas]
+        try:
+            first_id = self._bulk_insert(SQL_INSERT_MASCOTA, rows)
+        except sqlite3.Error as e:
+            logging.error("Error al insertar mascotas en lote: %s", e)
+            return None
+        for offset, mascota in enumerate(mascotas):
+            mascota.id = first_id + offset
+        logging.info("%s mascotas insertadas en lote.", len(mascotas))
+        return mascotas
+
+    def insert_consultas_bulk(self, consultas):
+        if not consultas:
+            return []
+        rows = [(c.fecha.isoformat(), c.motivo, c.diagnostico, c.mascota_id) for c in consultas]
+        try:
+            first_id = self._bulk_insert(SQL_INSERT_CONSULTA, rows)
+        except sqlite3.Error as e:
+            logging.error("Error al insertar consultas en lote: %s", e)
+            return None
+        for offset, consulta in enumerate(consultas):
+            consulta.id = first_id + offset
+        logging.info("%s consultas insertadas en lote.", len(consultas))
+        return consultas
+
 #Sistema Principal de la Veterinaria
 class SistemaVeterinaria:
+    __slots__ = ("db_manager",)
+
     def __init__(self):
         self.db_manager = DatabaseManager()
 
-    def _get_propietario_or_create(self, owner_name):
-        """Intenta obtener un propietario por nombre; si no existe, ofrece crearlo."""
+    def _prompt_propietario(self, owner_name):
+        """Busca un propietario por nombre; si no existe, pide sus datos y lo devuelve sin guardar (id None)."""
         propietario = self.db_manager.get_propietario_by_nombre(owner_name)
         if not propietario:
             UIUtils.print_message(f"El propietario '{owner_name}' no está registrado.")
             if UIUtils.confirm_action("¿Desea registrarlo ahora?"):
                 nombre = input("Nombre del NUEVO dueño: ").strip() # Podría ser diferente si el usuario se equivocó
-                propietario_existente = self.db_manager.get_propietario_by_nombre(nombre)
-                if propietario_existente:
-                    print(f"El propietario '{nombre}' ya existe. Asignando mascota a este propietario.")
-                    return propietario_existente
                 telefono = input("Teléfono del NUEVO dueño: ")
                 direccion = input("Dirección del NUEVO dueño: ")
-                propietario = Propietario(nombre, telefono, direccion)
-                propietario_registrado = self.db_manager.insert_propietario(propietario)
-                if propietario_registrado:
-                    print("Dueño registrado con éxito.")
-                    logging.info(f"Dueño: {propietario_registrado.nombre} (ID: {propietario_registrado.id}) registrado.")
-                return propietario_registrado
+                return Propietario(nombre, telefono, direccion)
             else:
                 UIUtils.print_message("Operación cancelada. Propietario no encontrado ni registrado.")
                 logging.info("Registro de mascota/operación cancelada: propietario no encontrado/registrado.")
@@ -417,29 +793,29 @@ class SistemaVeterinaria:
 
     def _get_mascota(self, prompt="Ingrese el ID de la mascota: "):
         """Solicita el ID de una mascota y la devuelve si existe."""
-        mascota_id = UIUtils.get_int_input(prompt, "ID de mascota inválido.")
+        mascota_id = UIUtils.get_id_input(prompt, "ID de mascota inválido.")
         mascota = self.db_manager.get_mascota_by_id(mascota_id)
         if not mascota:
             UIUtils.print_message(f"No se encontró ninguna mascota con el ID: {mascota_id}.")
-            logging.info(f"Mascota con ID {mascota_id} no encontrada.")
+            logging.info("Mascota con ID %s no encontrada.", mascota_id)
         return mascota
 
     def _get_propietario(self, prompt="Ingrese el ID del propietario: "):
         """Solicita el ID de un propietario y lo devuelve si existe."""
-        propietario_id = UIUtils.get_int_input(prompt, "ID de propietario inválido.")
+        propietario_id = UIUtils.get_id_input(prompt, "ID de propietario inválido.")
         propietario = self.db_manager.get_propietario_by_id(propietario_id)
         if not propietario:
             UIUtils.print_message(f"No se encontró ningún propietario con el ID: {propietario_id}.")
-            logging.info(f"Propietario con ID {propietario_id} no encontrado.")
+            logging.info("Propietario con ID %s no encontrado.", propietario_id)
         return propietario
 
     def _get_consulta(self, prompt="Ingrese el ID de la consulta: "):
         """Solicita el ID de una consulta y la devuelve si existe."""
-        consulta_id = UIUtils.get_int_input(prompt, "ID de consulta inválido.")
+        consulta_id = UIUtils.get_id_input(prompt, "ID de consulta inválido.")
         consulta = self.db_manager.get_consulta_by_id(consulta_id)
         if not consulta:
             UIUtils.print_message(f"No se encontró ninguna consulta con el ID: {consulta_id}.")
-            logging.info(f"Consulta con ID {consulta_id} no encontrada.")
+            logging.info("Consulta con ID %s no encontrada.", consulta_id)
         return consulta
 
     def registrar_mascota(self):
@@ -454,16 +830,41 @@ class SistemaVeterinaria:
 
         UIUtils.print_message("--- Información del Propietario ---")
         nombre_propietario = input("Ingrese el nombre del dueño existente o nuevo: ").strip()
-        propietario = self._get_propietario_or_create(nombre_propietario)
-
+        propietario = self._prompt_propietario(nombre_propietario)
         if not propietario:
-            return # Se canceló el registro del propietario o no se pudo crear.
+            return # Se canceló el registro del propietario.
 
-        mascota = Mascota(nombre_mascota, especie_mascota, raza_mascota, edad_mascota, propietario.id)
-        mascota_registrada = self.db_manager.insert_mascota(mascota)
+        # Todos los datos ya se pidieron: la transacción (y el bloqueo de escritura) dura solo las dos inserciones.
+        nuevo = propietario.id is None
+        creado = False
+        mascota_registrada = None
+        try:
+            with self.db_manager.transaction():
+                if nuevo:
+                    propietario, creado = self.db_manager.upsert_propietario(propietario)
+                if propietario:
+                    mascota = Mascota(nombre_mascota, especie_mascota, raza_mascota, edad_mascota, propietario.id)
+                    mascota_registrada = self.db_manager.insert_mascota(mascota)
+                    if not mascota_registrada:
+                        # insert_mascota ya registró el error; se deshace también el propietario recién creado.
+                        self.db_manager.rollback()
+        except sqlite3.Error as e:
+            # p. ej. "database is locked" al abrir BEGIN IMMEDIATE si otra conexión está escribiendo.
+            logging.error("Error al registrar mascota: %s", e)
+            UIUtils.print_message("No se pudo registrar la mascota. Intente nuevamente.")
+            return
+
+        if not propietario:
+            UIUtils.print_message("No se pudo registrar el propietario. Intente nuevamente.")
+            return
+        if mascota_registrada and creado:
+            print("Dueño registrado con éxito.")
+            logging.info("Dueño: %s (ID: %s) registrado.", propietario.nombre, propietario.id)
+        elif nuevo and not creado:
+            print(f"El propietario '{propietario.nombre}' ya existe. Asignando mascota a este propietario.")
         if mascota_registrada:
             print(f"\n - Mascota '{mascota_registrada.nombre}' registrada con ID: {mascota_registrada.id}, del dueño: {propietario.nombre}.")
-            logging.info(f"Mascota: {mascota_registrada.nombre} (ID: {mascota_registrada.id}), del dueño: {propietario.nombre} (ID: {propietario.id}) registrada.")
+            logging.info("Mascota: %s (ID: %s), del dueño: %s (ID: %s) registrada.", mascota_registrada.nombre, mascota_registrada.id, propietario.nombre, propietario.id)
         else:
             UIUtils.print_message("No se pudo registrar la mascota. Intente nuevamente.")
 
@@ -482,34 +883,34 @@ class SistemaVeterinaria:
         consulta_registrada = self.db_manager.insert_consulta(consulta)
         if consulta_registrada:
             print("Consulta registrada con éxito.")
-            logging.info(f"Consulta (ID: {consulta_registrada.id}) de la mascota: {mascota.nombre} (ID: {mascota.id}) registrada.")
+            logging.info("Consulta (ID: %s) de la mascota: %s (ID: %s) registrada.", consulta_registrada.id, mascota.nombre, mascota.id)
         else:
             UIUtils.print_message("No se pudo registrar la consulta.")
 
     def listar_propietarios(self):
         UIUtils.print_title("Lista de Propietarios")
-        propietarios = self.db_manager.get_all_propietarios()
-        if not propietarios:
+        lotes = self.db_manager.iter_propietarios()
+        primero = next(lotes, None)
+        if not primero:
             UIUtils.print_message("No existen propietarios registrados.")
             logging.info("Lista de propietarios consultada: No hay registros.")
             return
 
-        for prop in propietarios:
-            print(prop)
-            print("-" * 30)
+        for propietarios in chain((primero,), lotes):
+            sys.stdout.write("".join(f"{prop}\n{_ROW_SEP}\n" for prop in propietarios))
         logging.info("Propietarios registrados consultados.")
 
     def listar_mascotas(self):
         UIUtils.print_title("Lista de Mascotas Registradas")
-        mascotas = self.db_manager.get_all_mascotas()
-        if not mascotas:
+        lotes = self.db_manager.iter_mascotas()
+        primero = next(lotes, None)
+        if not primero:
             UIUtils.print_message("No existen mascotas registradas.")
             logging.info("Lista de mascotas consultada: No hay registros.")
             return
 
-        for mascota in mascotas:
-            print(mascota)
-            print("-" * 30)
+        for mascotas in chain((primero,), lotes):
+            sys.stdout.write("".join(f"{mascota}\n{_ROW_SEP}\n" for mascota in mascotas))
         logging.info("Mascotas registradas consultadas.")
 
     def historia_clinica(self):
@@ -518,17 +919,17 @@ class SistemaVeterinaria:
         if not mascota:
             return
 
-        consultas = self.db_manager.get_consultas_by_mascota_id(mascota.id)
-        if not consultas:
+        lotes = self.db_manager.iter_consultas_by_mascota_id(mascota.id)
+        primero = next(lotes, None)
+        if not primero:
             UIUtils.print_message(f"No hay consultas registradas para {mascota.nombre} (ID: {mascota.id}).")
-            logging.info(f"No se encontraron consultas para la mascota ID: {mascota.id}.")
+            logging.info("No se encontraron consultas para la mascota ID: %s.", mascota.id)
             return
 
         print(f"\nHistorial clínico de {mascota.nombre} (ID: {mascota.id}):")
-        for consulta in consultas:
-            print(consulta)
-            print("-" * 30)
-        logging.info(f"Historia clínica de la mascota ID: {mascota.id} consultada.")
+        for consultas in chain((primero,), lotes):
+            sys.stdout.write("".join(f"{consulta}\n{_ROW_SEP}\n" for consulta in consultas))
+        logging.info("Historia clínica de la mascota ID: %s consultada.", mascota.id)
 
     def actualizar_propietario(self):
         UIUtils.print_title("Actualizar Propietario")
@@ -545,7 +946,7 @@ class SistemaVeterinaria:
             existente = self.db_manager.get_propietario_by_nombre(nombre)
             if existente and existente.id != propietario.id:
                 print(f"Error: El nombre '{nombre}' ya está siendo usado por otro propietario (ID: {existente.id}).")
-                logging.warning(f"Intento de actualizar propietario ID {propietario.id} a nombre duplicado: {nombre}")
+                logging.warning("Intento de actualizar propietario ID %s a nombre duplicado: %s", propietario.id, nombre)
                 return
             new_data['nombre'] = nombre
 
@@ -560,7 +961,7 @@ class SistemaVeterinaria:
         if new_data:
             if self.db_manager.update_propietario(propietario.id, new_data):
                 print("Propietario actualizado con éxito.")
-                logging.info(f"Propietario ID {propietario.id} actualizado.")
+                logging.info("Propietario ID %s actualizado.", propietario.id)
             else:
                 UIUtils.print_message("No se pudo actualizar el propietario.")
         else:
@@ -597,7 +998,7 @@ class SistemaVeterinaria:
                 new_data['edad'] = edad
             except ValueError:
                 print("Edad inválida. Se mantendrá la edad actual.")
-                logging.warning(f"Intento de actualizar edad de mascota {mascota.id} con valor inválido: '{edad_str}'")
+                logging.warning("Intento de actualizar edad de mascota %s con valor inválido: '%s'", mascota.id, edad_str)
 
         if UIUtils.confirm_action("¿Desea cambiar el propietario de esta mascota?"):
             nombre_nuevo_propietario = input("Ingrese el nombre del nuevo propietario: ").strip()
@@ -607,12 +1008,12 @@ class SistemaVeterinaria:
                 print(f"Propietario de la mascota cambiado a: {nuevo_propietario.nombre}.")
             else:
                 UIUtils.print_message("Propietario no encontrado. No se cambió el propietario.")
-                logging.warning(f"Intento de cambiar propietario de mascota {mascota.id} a uno no existente: {nombre_nuevo_propietario}")
+                logging.warning("Intento de cambiar propietario de mascota %s a uno no existente: %s", mascota.id, nombre_nuevo_propietario)
 
         if new_data:
             if self.db_manager.update_mascota(mascota.id, new_data):
                 print("Mascota actualizada con éxito.")
-                logging.info(f"Mascota ID {mascota.id} actualizada.")
+                logging.info("Mascota ID %s actualizada.", mascota.id)
             else:
                 UIUtils.print_message("No se pudo actualizar la mascota.")
         else:
@@ -634,7 +1035,7 @@ class SistemaVeterinaria:
                 new_data['fecha'] = datetime.strptime(fecha_str, "%d-%m-%Y").date()
             except ValueError:
                 print("Formato de fecha incorrecto. Se mantendrá la fecha actual.")
-                logging.warning(f"Intento de actualizar fecha de consulta {consulta.id} con formato inválido: {fecha_str}")
+                logging.warning("Intento de actualizar fecha de consulta %s con formato inválido: %s", consulta.id, fecha_str)
 
         motivo = input(f"Nuevo motivo ({consulta.motivo}): ").strip()
         if motivo:
@@ -647,7 +1048,7 @@ class SistemaVeterinaria:
         if new_data:
             if self.db_manager.update_consulta(consulta.id, new_data):
                 print("Consulta actualizada con éxito.")
-                logging.info(f"Consulta ID {consulta.id} actualizada.")
+                logging.info("Consulta ID %s actualizada.", consulta.id)
             else:
                 UIUtils.print_message("No se pudo actualizar la consulta.")
         else:
@@ -662,12 +1063,12 @@ class SistemaVeterinaria:
         if UIUtils.confirm_action(f"¿Está seguro de eliminar al propietario '{propietario.nombre}' (ID: {propietario.id})? Esto también eliminará SUS MASCOTAS y todas sus CONSULTAS."):
             if self.db_manager.delete_propietario(propietario.id):
                 print("Propietario y sus datos asociados eliminados con éxito.")
-                logging.info(f"Propietario ID {propietario.id} y datos asociados eliminados.")
+                logging.info("Propietario ID %s y datos asociados eliminados.", propietario.id)
             else:
                 UIUtils.print_message("No se pudo eliminar el propietario.")
         else:
             print("Operación cancelada.")
-            logging.info(f"Eliminación de propietario ID {propietario.id} cancelada.")
+            logging.info("Eliminación de propietario ID %s cancelada.", propietario.id)
 
     def eliminar_mascota(self):
         UIUtils.print_title("Eliminar Mascota")
@@ -678,12 +1079,12 @@ class SistemaVeterinaria:
         if UIUtils.confirm_action(f"¿Está seguro de eliminar a la mascota '{mascota.nombre}' (ID: {mascota.id})? Esto también eliminará todas sus CONSULTAS."):
             if self.db_manager.delete_mascota(mascota.id):
                 print("Mascota y sus consultas eliminadas con éxito.")
-                logging.info(f"Mascota ID {mascota.id} y consultas asociadas eliminadas.")
+                logging.info("Mascota ID %s y consultas asociadas eliminadas.", mascota.id)
             else:
                 UIUtils.print_message("No se pudo eliminar la mascota.")
         else:
             print("Operación cancelada.")
-            logging.info(f"Eliminación de mascota ID {mascota.id} cancelada.")
+            logging.info("Eliminación de mascota ID %s cancelada.", mascota.id)
 
     def eliminar_consulta(self):
         UIUtils.print_title("Eliminar Consulta")
@@ -691,78 +1092,107 @@ class SistemaVeterinaria:
         if not consulta:
             return
 
-        if UIUtils.confirm_action(f"¿Está seguro de eliminar la consulta con ID: {consulta.id} para la mascota '{consulta.mascota_nombre}'?"):
-            if self.db_manager.delete_consulta(consulta.id):
-                print("Consulta eliminada con éxito.")
-                logging.info(f"Consulta ID {consulta.id} eliminada.")
-            else:
-                UIUtils.print_message("No se pudo eliminar la consulta.")
-        else:
+        # Se confirma antes de borrar para no mantener abierta una transacción mientras el usuario responde.
+        if not UIUtils.confirm_action(f"¿Está seguro de eliminar la consulta con ID: {consulta.id} para la mascota '{consulta.mascota_nombre}'?"):
             print("Operación cancelada.")
-            logging.info(f"Eliminación de consulta ID {consulta.id} cancelada.")
+            logging.info("Eliminación de consulta ID %s cancelada.", consulta.id)
+            return
+
+        if self.db_manager.delete_consulta(consulta.id):
+            print("Consulta eliminada con éxito.")
+            logging.info("Consulta ID %s eliminada.", consulta.id)
+        else:
+            UIUtils.print_message("No se pudo eliminar la consulta.")
 
 # --- Función Principal del Programa ---
+_BANNER = _render_title("Sistema Veterinaria Amigos Peludos")
+
+_MENU = (
+    "Gestión de Registros\n"
+    "1. Registrar nueva mascota (incluye registro de propietario)\n"
+    "2. Registrar nueva consulta\n"
+    "Consultar Registros\n"
+    "3. Ver lista de propietarios\n"
+    "4. Ver lista de mascotas\n"
+    "5. Ver historia clínica de una mascota\n"
+    "Actualizar Registros\n"
+    "6. Actualizar propietario\n"
+    "7. Actualizar mascota\n"
+    "8. Actualizar consulta\n"
+    "Eliminar Registros\n"
+    "9. Eliminar propietario\n"
+    "10. Eliminar mascota\n"
+    "11. Eliminar consulta\n"
+    "12. Salir del sistema\n"
+)
+
 def main():
+    #Los handlers reales se atienden en un hilo aparte; el menú solo encola los registros.
+    root_logger = logging.getLogger()
+    file_handlers = root_logger.handlers[:]
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, *file_handlers, respect_handler_level=True)
+    root_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
+
     logging.info("Se inició la aplicación")
-    sistema = SistemaVeterinaria()
+    sistema = None
     try:
+        sistema = SistemaVeterinaria()
+        actions = {
+            '1': sistema.registrar_mascota,
+            '2': sistema.registrar_consulta,
+            '3': sistema.listar_propietarios,
+            '4': sistema.listar_mascotas,
+            '5': sistema.historia_clinica,
+            '6': sistema.actualizar_propietario,
+            '7': sistema.actualizar_mascota,
+            '8': sistema.actualizar_consulta,
+            '9': sistema.eliminar_propietario,
+            '10': sistema.eliminar_mascota,
+            '11': sistema.eliminar_consulta,
+        }
+        valid_options = frozenset(actions) | {'12'}
+        _msg = UIUtils.print_message
+        #Con stdin redirigido (pipe o archivo) no se dibuja el menú y el fin de la entrada cierra el programa.
+        interactive = sys.stdin.isatty()
+        readline = sys.stdin.readline
         while True:
-            UIUtils.print_title("Sistema Veterinaria Amigos Peludos")
-
-            print("Gestión de Registros")
-            print("1. Registrar nueva mascota (incluye registro de propietario)")
-            print("2. Registrar nueva consulta")
-            print("Consultar Registros")
-            print("3. Ver lista de propietarios")
-            print("4. Ver lista de mascotas")
-            print("5. Ver historia clínica de una mascota")
-            print("Actualizar Registros")
-            print("6. Actualizar propietario")
-            print("7. Actualizar mascota")
-            print("8. Actualizar consulta")
-            print("Eliminar Registros")
-            print("9. Eliminar propietario")
-            print("10. Eliminar mascota")
-            print("11. Eliminar consulta")
-            print("12. Salir del sistema")
-
-            UIUtils.print_message("Elija una opción: ")
-            opcion = input("> ")
-
-            if opcion == '1':
-                sistema.registrar_mascota()
-            elif opcion == '2':
-                sistema.registrar_consulta()
-            elif opcion == '3':
-                sistema.listar_propietarios()
-            elif opcion == '4':
-                sistema.listar_mascotas()
-            elif opcion == '5':
-                sistema.historia_clinica()
-            elif opcion == '6':
-                sistema.actualizar_propietario()
-            elif opcion == '7':
-                sistema.actualizar_mascota()
-            elif opcion == '8':
-                sistema.actualizar_consulta()
-            elif opcion == '9':
-                sistema.eliminar_propietario()
-            elif opcion == '10':
-                sistema.eliminar_mascota()
-            elif opcion == '11':
-                sistema.eliminar_consulta()
-            elif opcion == '12':
+            if interactive:
+                sys.stdout.write(_BANNER)
+                sys.stdout.write(_MENU)
+                sys.stdout.flush()
+
+                _msg("Elija una opción: ")
+                opcion = input("> ")
+            else:
+                line = readline()
+                if not line:
+                    logging.info("Se cerró la aplicación")
+                    break
+                opcion = line.strip()
+
+            if opcion not in valid_options:
+                print("Opción inválida. Por favor, intente nuevamente.")
+                continue
+            if opcion == '12':
                 print("¡Gracias por usar el sistema! Hasta luego.")
                 logging.info("Se cerró la aplicación")
                 break
-            else:
-                print("Opción inválida. Por favor, intente nuevamente.")
+            actions[opcion]()
     except Exception as e:
-        logging.critical(f"Ocurrió un error crítico inesperado: {e}", exc_info=True)
+        logging.critical("Ocurrió un error crítico inesperado: %s", e, exc_info=True)
         print(f"Ocurrió un error inesperado: {e}")
         print("Por favor, revise el archivo de log para más detalles.")
     finally:
-        sistema.db_manager.close_connection()
+        # Si SistemaVeterinaria() falló no hay conexión que cerrar; un fallo al cerrar no debe ocultar el error original.
+        if sistema is not None and sistema.db_manager:
+            try:
+                sistema.db_manager.close_connection()
+            except sqlite3.Error as e:
+                logging.error("Error al cerrar la conexión: %s", e)
+        listener.stop()
+        root_logger.handlers = file_handlers
 
 if __name__ == "__main__":
     main()
\ No newline at end of file